@@ -0,0 +1,210 @@
+import os
+import json
+import hashlib
+import inspect
+import itertools as it
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from StockSimulator import SimpleStock
+from RL_Trading import TraderAgent_QLearning
+
+
+
+def param_grid(**params):
+    """Expands lists of parameter values into all their combinations.
+    Args:
+        **params: parameter name -> list of values,
+            e.g. gamma=[0.9, 1], alpha=[0.1, 0.5].
+    Returns:
+        (list[dict]): one config per combination.
+    """
+    names = list(params)
+    return [dict(zip(names, values)) for values in it.product(*params.values())]
+
+
+
+def config_key(config, names):
+    """Hashable identity of a config (or of the result it produced),
+    used to skip finished cells on resume.
+    """
+    return tuple(config.get(name) for name in names)
+
+
+
+def run_signature(run_kwargs, transition_matrix=None, growth_probabilities=None):
+    """Short hash of everything besides the config that a result depends on:
+    the run_config arguments (with their defaults filled in) and the model
+    matrices (SimpleStock's own unless overridden). Stored with each result,
+    so that results of a different budget or model are never resumed from.
+    """
+    arguments = inspect.signature(run_config).bind(None, **run_kwargs)
+    arguments.apply_defaults()
+    del arguments.arguments["config"]
+
+    if transition_matrix is None:
+        transition_matrix = SimpleStock.transition_matrix
+    if growth_probabilities is None:
+        growth_probabilities = SimpleStock.growth_probabilities
+
+    signature = json.dumps([arguments.arguments,
+                            np.asarray(transition_matrix, dtype=float).tolist(),
+                            np.asarray(growth_probabilities, dtype=float).tolist()], sort_keys=True)
+
+    return hashlib.sha1(signature.encode()).hexdigest()[:12]
+
+
+
+def load_results(results_path):
+    """Reads all results streamed so far to an append-only results file.
+    A partially written last line (e.g. from an interrupted sweep) is ignored.
+    Args:
+        results_path (str): path to the JSON-lines results file.
+    Returns:
+        (list[dict]): one result per finished config.
+    """
+    results = []
+    if not os.path.exists(results_path):
+        return results
+
+    with open(results_path) as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+
+    return results
+
+
+
+def _drop_partial_line(results_path):
+    """Truncates a partially written last line left by an interrupted
+    sweep, so that new results are appended on a line of their own.
+    """
+    if not os.path.exists(results_path):
+        return
+
+    with open(results_path, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+
+
+def _init_worker(transition_matrix, growth_probabilities):
+    """Overrides SimpleStock's model matrices once per worker process,
+    instead of shipping them with every config. None keeps the default.
+    """
+    if transition_matrix is not None:
+        SimpleStock.transition_matrix = pd.DataFrame(
+            transition_matrix, index=SimpleStock.indicator_values, columns=SimpleStock.indicator_values)
+    if growth_probabilities is not None:
+        SimpleStock.growth_probabilities = pd.DataFrame(
+            growth_probabilities, index=SimpleStock.indicator_values, columns=SimpleStock.stock_growths)
+
+
+
+def run_config(config, n_episodes=500, n_days=14, eval_episodes=50, window=50, tol=0.01):
+    """Trains a TraderAgent_QLearning on one config and summarizes the outcome.
+    Args:
+        config (dict): must contain gamma, alpha and transaction_cost;
+            an optional seed makes the run reproducible.
+        n_episodes (int): number of training episodes (SimpleStock instances).
+        n_days (int): trading days per episode, before closing out.
+        eval_episodes (int): number of last episodes the final metrics are averaged over.
+        window (int): number of episodes the convergence criterion is averaged over.
+        tol (float): the Q table counts as converged once its relative change per
+            episode, sum(|Q_HAT - Q_before|) / sum(|Q_HAT|), averaged over the
+            last window episodes, is at most tol.
+    Returns:
+        (dict): the config plus final_reward, net_cashflow (both averaged per
+            episode over the last eval_episodes) and convergence_step (number of
+            simulated steps until convergence, None if not reached).
+    """
+    np.random.seed(config.get("seed"))
+    trader = TraderAgent_QLearning(stock=SimpleStock, gamma=config["gamma"], alpha=config["alpha"])
+
+    rewards, cashflows, changes = [], [], []
+    steps, convergence_step = 0, None
+
+    for _ in range(n_episodes):
+        Q_before = trader.Q_HAT.copy()
+        stock = SimpleStock(transaction_cost=config["transaction_cost"], random_init=True)
+        stock.simulate_trading_day(Ndays=n_days, trader=trader)
+
+        steps += len(stock.transaction_history)
+        rewards.append(sum(stock.reward_history))
+        cashflows.append(sum(stock.cashflow_history))
+
+        Q_norm = np.abs(trader.Q_HAT).sum()
+        changes.append(np.abs(trader.Q_HAT - Q_before).sum() / Q_norm if Q_norm > 0 else np.inf)
+        if convergence_step is None and len(changes) >= window and np.mean(changes[-window:]) <= tol:
+            convergence_step = steps
+
+    result = dict(config)
+    result["final_reward"] = float(np.mean(rewards[-eval_episodes:]))
+    result["net_cashflow"] = float(np.mean(cashflows[-eval_episodes:]))
+    result["convergence_step"] = convergence_step
+
+    return result
+
+
+
+def run_sweep(grid, results_path, max_workers=None, transition_matrix=None,
+              growth_probabilities=None, **run_kwargs):
+    """Runs every config of the grid over a process pool, appending each
+    result to results_path as soon as it finishes. Configs already present
+    in results_path with the same run_signature are skipped, so an interrupted
+    sweep can be resumed by calling run_sweep again with the same arguments,
+    while a different budget or model reruns every config.
+    Args:
+        grid (list[dict]): configs, e.g. from param_grid.
+        results_path (str): path to the JSON-lines results file.
+        max_workers (int): number of worker processes (defaults to the CPU count).
+        transition_matrix, growth_probabilities (np.ndarray): optional overrides of
+            SimpleStock's model matrices, installed once in every worker; the whole
+            sweep then runs on the overridden model. None keeps SimpleStock's own.
+        **run_kwargs: passed on to run_config.
+    Returns:
+        (list[dict]): results of all configs of the grid, finished before or now,
+            each with its run_signature under "run".
+    """
+    if not grid:
+        return []
+
+    run = run_signature(run_kwargs, transition_matrix, growth_probabilities)
+    grid = [dict(config, run=run) for config in grid]
+    names = list(grid[0])
+    results = load_results(results_path)
+    done = {config_key(r, names) for r in results}
+    pending = [c for c in grid if config_key(c, names) not in done]
+    _drop_partial_line(results_path)
+
+    initargs = (transition_matrix, growth_probabilities)
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as pool, \
+            open(results_path, "a") as f:
+        futures = [pool.submit(run_config, config, **run_kwargs) for config in pending]
+
+        for future in as_completed(futures):
+            result = future.result()
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            results.append(result)
+
+    keys = {config_key(c, names) for c in grid}
+    return [r for r in results if config_key(r, names) in keys]
+
+
+
+
+if __name__ == "__main__":
+
+    grid = param_grid(gamma=[0.5, 0.9, 1],
+                      alpha=[0.1, 0.5, 1],
+                      transaction_cost=[0, 0.5, 1],
+                      seed=[0])
+    results = run_sweep(grid, "sweep_results.jsonl", n_episodes=500, n_days=14)
+
+    print(pd.DataFrame(results).sort_values("final_reward", ascending=False).to_string(index=False))
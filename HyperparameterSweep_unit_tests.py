@@ -0,0 +1,90 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+from HyperparameterSweep import param_grid, load_results, run_config, run_signature, run_sweep
+
+
+class Tests(unittest.TestCase):
+
+    def test_param_grid_1(self):
+        """All combinations of parameter values.
+        """
+        grid = param_grid(gamma=[0.5, 1], alpha=[0.1, 0.5, 1])
+        self.assertEqual(len(grid), 6)
+        self.assertIn({"gamma": 1, "alpha": 0.5}, grid)
+
+
+    def test_resume_1(self):
+        """Finished configs are not rerun, unfinished ones are.
+        """
+        grid = param_grid(gamma=[0.9], alpha=[0.5, 1], transaction_cost=[0], seed=[0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.jsonl")
+            run = run_signature({"n_episodes": 3, "n_days": 5})
+            finished = dict(grid[0], run=run, final_reward=123, net_cashflow=0, convergence_step=None)
+            with open(path, "w") as f:
+                f.write(json.dumps(finished) + "\n")
+                # partially written line of an interrupted sweep
+                f.write('{"gamma": 0.9, "alp')
+
+            results = run_sweep(grid, path, max_workers=1, n_episodes=3, n_days=5)
+            self.assertEqual(len(results), 2)
+            self.assertIn(finished, results)
+            self.assertEqual(len(load_results(path)), 2)
+
+
+    def test_resume_2(self):
+        """Results of a different budget or model are not resumed from.
+        """
+        grid = param_grid(gamma=[0.9], alpha=[0.5], transaction_cost=[0], seed=[0])
+        growth_probabilities = np.zeros((5, 5))
+        growth_probabilities[:, -1] = 1
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.jsonl")
+            first = run_sweep(grid, path, max_workers=1, n_episodes=3, n_days=5)
+            self.assertEqual(run_sweep(grid, path, max_workers=1, n_episodes=3, n_days=5), first)
+
+            run_sweep(grid, path, max_workers=1, n_episodes=4, n_days=5)
+            run_sweep(grid, path, max_workers=1, growth_probabilities=growth_probabilities,
+                      n_episodes=3, n_days=5)
+            self.assertEqual(len({r["run"] for r in load_results(path)}), 3)
+
+        # defaults filled in give the same signature as passing them explicitly
+        self.assertEqual(run_signature({}), run_signature({"n_episodes": 500}))
+
+
+    def test_convergence_1(self):
+        """Convergence step is reached with a small learning rate.
+        """
+        config = {"gamma": 0.9, "alpha": 0.1, "transaction_cost": 0, "seed": 0}
+        result = run_config(config, n_episodes=300, window=50, tol=0.01)
+
+        self.assertIsNotNone(result["convergence_step"])
+        self.assertGreater(result["convergence_step"], 50 * 14)
+
+
+    def test_model_override_1(self):
+        """Overridden model matrices are installed in the workers.
+        """
+        # price always grows by 2, so longing then closing out is profitable
+        growth_probabilities = np.zeros((5, 5))
+        growth_probabilities[:, -1] = 1
+        grid = param_grid(gamma=[0.9], alpha=[0.5], transaction_cost=[0], seed=[0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.jsonl")
+            default = run_sweep(grid, path, max_workers=1, n_episodes=3, n_days=5)
+            overridden = run_sweep(grid, path, max_workers=1, growth_probabilities=growth_probabilities,
+                                   n_episodes=3, n_days=5)
+
+        self.assertNotEqual(default[0]["final_reward"], overridden[0]["final_reward"])
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
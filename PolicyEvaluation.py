@@ -0,0 +1,354 @@
+import numpy as np
+from StockSimulator import SimpleStock
+from RL_Trading import TraderAgent_Random, TraderAgent_QLearning
+
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded memory (a simplified KLL sketch).
+    Values are kept in levels; an item at level h stands for 2^h observed values.
+    Whenever a level holds k items, it is sorted and every other item is
+    promoted to the next level, so memory grows only with log(n / k).
+
+    Attributes:
+        k (int): capacity of each level; larger k gives more accurate quantiles.
+        levels (list[np.ndarray]): items retained at each level.
+    """
+
+    def __init__(self, k=256):
+        """
+        Args:
+            k (int): capacity of each level.
+        """
+        self.k = k
+        self.levels = [np.array([])]
+
+
+    def update(self, x):
+        """Adds a batch of values to the sketch.
+        """
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(x, dtype=float)])
+
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) >= self.k:
+                items = np.sort(items)
+                # an odd item out stays at this level
+                if len(items) % 2:
+                    self.levels[h], items = items[-1:], items[:-1]
+                else:
+                    self.levels[h] = np.array([])
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.array([]))
+                promoted = items[np.random.randint(2)::2]
+                self.levels[h+1] = np.concatenate([self.levels[h+1], promoted])
+            h += 1
+
+
+    def quantile(self, q):
+        """Approximate q-quantile(s) of all values added so far.
+        Args:
+            q (float or np.ndarray): quantile(s) in [0, 1].
+        """
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(x), 2.0**h) for h, x in enumerate(self.levels)])
+        order = np.argsort(items)
+        cum_weights = np.cumsum(weights[order])
+        i = np.searchsorted(cum_weights, np.asarray(q) * cum_weights[-1])
+
+        return items[order][np.minimum(i, len(items) - 1)]
+
+
+
+
+class StreamingStats:
+    """Single-pass, constant-memory summary of a stream of values:
+    count, mean and variance (merged batch-wise with Chan et al.'s update),
+    min, max and quantiles from a QuantileSketch.
+    """
+
+    def __init__(self, k=256):
+        """
+        Args:
+            k (int): capacity of each level of the quantile sketch.
+        """
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(k)
+
+
+    def update(self, x):
+        """Adds a batch of values.
+        """
+        x = np.asarray(x, dtype=float)
+        if len(x) == 0:
+            return
+
+        n, mean, M2 = len(x), x.mean(), ((x - x.mean())**2).sum()
+        delta = mean - self.mean
+        total = self.n + n
+        self.mean += delta * n / total
+        self.M2 += M2 + delta**2 * self.n * n / total
+        self.n = total
+
+        self.min = min(self.min, x.min())
+        self.max = max(self.max, x.max())
+        self.sketch.update(x)
+
+
+    @property
+    def variance(self):
+        return self.M2 / (self.n - 1) if self.n > 1 else 0.0
+
+
+    def ci_halfwidth(self, z=1.96):
+        """Half-width of the normal confidence interval of the mean.
+        """
+        return z * np.sqrt(self.variance / self.n) if self.n > 0 else np.inf
+
+
+    def summary(self, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), z=1.96):
+        """
+        Returns:
+            (dict): n, mean, CI half-width, std, min, max and the requested quantiles.
+        """
+        summary = {"n": self.n, "mean": self.mean, "ci": self.ci_halfwidth(z),
+                   "std": np.sqrt(self.variance), "min": self.min, "max": self.max}
+        for q, value in zip(quantiles, self.sketch.quantile(np.array(quantiles))):
+            summary[f"q{q:g}"] = value
+
+        return summary
+
+
+
+
+def policy_table(trader, stock=SimpleStock):
+    """Freezes a trader's current policy into a table of action probabilities.
+    TraderAgent_QLearning (and subclasses) act by softmax over each Q_HAT row,
+    or uniformly at random if the row is all zero, as in make_transaction.
+    TraderAgent_Random acts uniformly at random.
+    Returns:
+        probs (np.ndarray): shape (len(stock.states), len(stock.transactions)),
+            rows ordered as stock.states.
+    Raises:
+        TypeError: if the trader's policy cannot be frozen into a table.
+    """
+    n_states, n_actions = len(stock.states), len(stock.transactions)
+
+    if isinstance(trader, TraderAgent_Random):
+        return np.full((n_states, n_actions), 1 / n_actions)
+    if not isinstance(trader, TraderAgent_QLearning):
+        raise TypeError(f"Cannot freeze the policy of {type(trader).__name__} into a table.")
+
+    Q = trader.Q_HAT
+    z = np.exp(Q - Q.max(axis=1, keepdims=True))
+    probs = z / z.sum(axis=1, keepdims=True)
+    probs[np.all(Q == 0, axis=1)] = 1 / n_actions
+
+    return probs
+
+
+
+def _sample_rows(cum_probs, rows):
+    """Samples one column index per row of a cumulative probability table.
+    """
+    u = np.random.random(len(rows))
+    i = (u[:, None] > cum_probs[rows]).sum(axis=1)
+
+    return np.minimum(i, cum_probs.shape[1] - 1)
+
+
+
+def process_transactions(lots, position, price, prev_price, transaction, transaction_cost=0, stock=SimpleStock):
+    """Vectorized SimpleStock._process_transaction over a batch of portfolios.
+    A portfolio is stored as lot counts per price, which suffices since it never
+    holds longs and shorts at once: lots[b, p] shares bought (if position > 0)
+    or shorted (if position < 0) at price stock.price_bounds[0] + p. As in SimpleStock,
+    longs are sold cheapest first, shorts are closed most expensive first, invalid
+    transactions become a 'hold', and each share costs transaction_cost * N to trade.
+    Args:
+        lots (np.ndarray): shape (batch, n_prices), updated in place.
+        position, price, prev_price, transaction (np.ndarray): shape (batch,).
+    Returns:
+        actual_transaction, reward, cashflow (np.ndarray): shape (batch,).
+    """
+    lo, hi = stock.position_bounds
+    valid = (position + transaction >= lo) & (position + transaction <= hi)
+    actual_transaction = np.where(valid, transaction, 0)
+    N = np.abs(actual_transaction)
+    buy, sell = actual_transaction > 0, actual_transaction < 0
+
+    # shares that close out existing lots vs. open new ones
+    n_close = np.where(buy, np.minimum(N, np.maximum(-position, 0)),
+                       np.where(sell, np.minimum(N, np.maximum(position, 0)), 0))
+    n_open = N - n_close
+
+    # lots closed out, only computed for the portfolios that close any
+    closing = np.flatnonzero(n_close)
+    closing_lots = lots[closing]
+    cum_lots = np.cumsum(closing_lots, axis=1)
+    before = np.where(buy[closing, None],
+                      cum_lots[:, -1:] - cum_lots,   # shares at dearer prices
+                      cum_lots - closing_lots)       # shares at cheaper prices
+    removed = np.minimum(np.maximum(n_close[closing, None] - before, 0), closing_lots)
+
+    lot_prices = np.arange(stock.price_bounds[0], stock.price_bounds[1]+1)
+    closed_value = np.zeros(len(lots))
+    closed_value[closing] = removed @ lot_prices
+    reward = np.where(buy, closed_value - n_close * price, n_close * price - closed_value)
+    reward = reward - transaction_cost * N * N
+    reward = np.where(actual_transaction == 0, (price - prev_price) * position, reward)
+    cashflow = -actual_transaction * price - transaction_cost * N * N
+
+    lots[closing] -= removed
+    lots[np.arange(len(lots)), price - stock.price_bounds[0]] += n_open
+
+    return actual_transaction, reward, cashflow
+
+
+
+def rollout_batch(probs, batch_size, Ndays=14, transaction_cost=0, random_init=True,
+                  trade_till_position_0=True, max_days=None, stock=SimpleStock):
+    """Simulates batch_size independent episodes of SimpleStock dynamics at once,
+    with each transaction drawn from the frozen policy table probs. Mirrors
+    simulate_trading_day: an episode runs Ndays days and then, if
+    trade_till_position_0, until its position is 0 (capped at max_days).
+    After Ndays, only the episodes still closing out are simulated further.
+    Returns:
+        total_reward, net_cashflow, max_drawdown (np.ndarray): per episode; the
+            drawdown is the largest drop of the cumulative reward from its peak.
+        truncated (np.ndarray): per episode, whether it was stopped by max_days
+            with an open position (its net cashflow then misses the close-out).
+    """
+    max_days = 50 * Ndays if max_days is None else max_days
+    indicator_values = np.array(stock.indicator_values)
+    stock_growths = np.array(stock.stock_growths)
+    transactions = np.array(stock.transactions)
+    n_prices = stock.price_bounds[1] - stock.price_bounds[0] + 1
+    n_positions = stock.position_bounds[1] - stock.position_bounds[0] + 1
+
+    cum_transition = np.cumsum(stock.transition_matrix.to_numpy(), axis=1)
+    cum_growth = np.cumsum(stock.growth_probabilities.to_numpy(), axis=1)
+    cum_policy = np.cumsum(probs, axis=1)
+
+    if random_init:
+        indicator = np.random.randint(len(indicator_values), size=batch_size)
+        price = np.random.randint(45, 55+1, size=batch_size)
+    else:
+        indicator = np.full(batch_size, indicator_values.tolist().index(0))
+        price = np.full(batch_size, 50)
+
+    # state of the episodes still running, and their index in the batch
+    episode = np.arange(batch_size)
+    prev_price = price.copy()
+    position = np.zeros(batch_size, dtype=int)
+    lots = np.zeros((batch_size, n_prices), dtype=int)
+    total_reward, net_cashflow = np.zeros(batch_size), np.zeros(batch_size)
+    peak, max_drawdown = np.zeros(batch_size), np.zeros(batch_size)
+
+    results = np.zeros((3, batch_size))
+    truncated = np.zeros(batch_size, dtype=bool)
+
+    for day in range(max_days):
+
+        # store finished episodes and stop simulating them
+        if day >= Ndays:
+            done = ~(trade_till_position_0 & (position != 0))
+            results[:, episode[done]] = total_reward[done], net_cashflow[done], max_drawdown[done]
+            keep = ~done
+            episode, indicator, price, prev_price, position, lots = \
+                episode[keep], indicator[keep], price[keep], prev_price[keep], position[keep], lots[keep]
+            total_reward, net_cashflow, peak, max_drawdown = \
+                total_reward[keep], net_cashflow[keep], peak[keep], max_drawdown[keep]
+            if len(episode) == 0:
+                break
+
+        # row of (indicator, price, position) in stock.states
+        state = (indicator * n_prices + price - stock.price_bounds[0]) * n_positions \
+                + position - stock.position_bounds[0]
+        transaction = transactions[_sample_rows(cum_policy, state)]
+
+        actual_transaction, reward, cashflow = process_transactions(
+            lots, position, price, prev_price, transaction, transaction_cost, stock)
+        position = position + actual_transaction
+
+        total_reward += reward
+        net_cashflow += cashflow
+        peak = np.maximum(peak, total_reward)
+        max_drawdown = np.maximum(max_drawdown, peak - total_reward)
+
+        # next-period price and indicator, both driven by the current indicator
+        growth = stock_growths[_sample_rows(cum_growth, indicator)]
+        prev_price = price
+        price = np.clip(price + growth, *stock.price_bounds)
+        indicator = _sample_rows(cum_transition, indicator)
+
+    else:
+        # episodes still running after max_days
+        results[:, episode] = total_reward, net_cashflow, max_drawdown
+        truncated[episode] = trade_till_position_0 & (position != 0)
+
+    return results[0], results[1], results[2], truncated
+
+
+
+def evaluate_policy(trader, Ndays=14, transaction_cost=0, random_init=True, batch_size=10000,
+                    max_episodes=1000000, min_episodes=10000, tol=0.1, z=1.96,
+                    target="net_cashflow", max_days=None, k=256):
+    """Monte Carlo evaluation of a trader's frozen policy. Rolls out batches of
+    episodes until the confidence interval half-width of the target statistic's
+    mean is at most tol, or max_episodes have been simulated. Episodes stopped
+    by max_days with an open position are left out of the statistics, since
+    their net cashflow misses the close-out; only their number is returned.
+    Args:
+        trader (TraderAgent): the trader to evaluate; its policy is frozen
+            with policy_table and it does not learn during evaluation.
+        tol (float): target confidence interval half-width.
+        z (float): normal quantile of the confidence level.
+        target (str): "reward", "net_cashflow" or "drawdown".
+        k (int): capacity of each level of the quantile sketches.
+    Returns:
+        stats (dict): StreamingStats of "reward", "net_cashflow" and "drawdown" per episode.
+        truncated (int): number of episodes stopped by max_days with an open
+            position, and left out of stats.
+    """
+    probs = policy_table(trader)
+    stats = {name: StreamingStats(k) for name in ["reward", "net_cashflow", "drawdown"]}
+    n_simulated, truncated = 0, 0
+
+    while n_simulated < max_episodes:
+        n = min(batch_size, max_episodes - n_simulated)
+        reward, net_cashflow, drawdown, is_truncated = rollout_batch(
+            probs, n, Ndays, transaction_cost, random_init,
+            trader.trade_till_position_0, max_days)
+        n_simulated += n
+        truncated += int(np.count_nonzero(is_truncated))
+
+        stats["reward"].update(reward[~is_truncated])
+        stats["net_cashflow"].update(net_cashflow[~is_truncated])
+        stats["drawdown"].update(drawdown[~is_truncated])
+
+        if stats[target].n >= min_episodes and stats[target].ci_halfwidth(z) <= tol:
+            break
+
+    return stats, truncated
+
+
+
+
+if __name__ == "__main__":
+
+    import pandas as pd
+
+    q_trader = TraderAgent_QLearning(stock=SimpleStock, gamma=0.9, alpha=0.5)
+    for _ in range(500):
+        SimpleStock(random_init=True).simulate_trading_day(Ndays=14, trader=q_trader)
+
+    for name, trader in [("Random", TraderAgent_Random(SimpleStock)), ("Q-Learning", q_trader)]:
+        stats, truncated = evaluate_policy(trader)
+        print(f"========== {name} (truncated: {truncated}) ==========")
+        print(pd.DataFrame({k: v.summary() for k, v in stats.items()}).T.to_string())
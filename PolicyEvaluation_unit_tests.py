@@ -0,0 +1,106 @@
+import unittest
+import numpy as np
+from StockSimulator import SimpleStock
+from RL_Trading import TraderAgent, TraderAgent_Random, TraderAgent_QLearning
+from PolicyEvaluation import StreamingStats, process_transactions, rollout_batch, policy_table, evaluate_policy
+
+
+class Tests(unittest.TestCase):
+
+    def test_process_transactions_1(self):
+        """Vectorized transactions match SimpleStock on random sequences.
+        """
+        np.random.seed(0)
+        batch, days = 50, 30
+        stocks = [SimpleStock(initial_price=50, transaction_cost=0.5) for _ in range(batch)]
+        n_prices = SimpleStock.price_bounds[1] - SimpleStock.price_bounds[0] + 1
+        lots = np.zeros((batch, n_prices), dtype=int)
+        position = np.zeros(batch, dtype=int)
+        price, prev_price = np.full(batch, 50), np.full(batch, 50)
+
+        for _ in range(days):
+            transaction = np.random.choice(SimpleStock.transactions, size=batch)
+            act, reward, cashflow = process_transactions(lots, position, price, prev_price, transaction, 0.5)
+            position = position + act
+
+            for b, stock in enumerate(stocks):
+                truth = stock._process_transaction(transaction[b])
+                self.assertEqual(act[b], truth[0])
+                self.assertAlmostEqual(reward[b], truth[1])
+                self.assertAlmostEqual(cashflow[b], truth[2])
+                self.assertEqual(position[b], stock.position)
+
+                # same price path for both
+                stock.price_history.append(stock.price)
+                stock.price += np.random.choice(SimpleStock.stock_growths)
+
+            prev_price = price
+            price = np.array([stock.price for stock in stocks])
+
+
+    def test_streaming_stats_1(self):
+        """Batch-merged moments and sketch quantiles of a stream.
+        """
+        np.random.seed(0)
+        x = np.random.normal(3, 2, size=100000)
+        stats = StreamingStats(k=256)
+        for chunk in np.array_split(x, 37):
+            stats.update(chunk)
+
+        self.assertEqual(stats.n, len(x))
+        self.assertAlmostEqual(stats.mean, x.mean())
+        self.assertAlmostEqual(stats.variance, x.var(ddof=1))
+        self.assertLess(sum(len(level) for level in stats.sketch.levels), 256 * 12)
+        for q in [0.05, 0.5, 0.95]:
+            self.assertAlmostEqual(stats.sketch.quantile(q), np.quantile(x, q), delta=0.1)
+
+
+    def test_rollout_batch_1(self):
+        """Episodes of a random trader last exactly Ndays.
+        """
+        np.random.seed(0)
+        probs = policy_table(TraderAgent_Random(SimpleStock))
+        reward, net_cashflow, drawdown, truncated = rollout_batch(
+            probs, 1000, Ndays=5, trade_till_position_0=False)
+
+        self.assertEqual(reward.shape, (1000,))
+        self.assertFalse(truncated.any())
+        self.assertTrue(np.all(drawdown >= 0))
+
+
+    def test_rollout_batch_2(self):
+        """Episodes still open at max_days are flagged and left out of the stats.
+        """
+        np.random.seed(0)
+        trader = TraderAgent_QLearning(SimpleStock, gamma=0.9, alpha=0.5)
+        # always long as much as possible, so no episode ever closes out
+        trader.Q_HAT[:, -1] = 100
+        probs = policy_table(trader)
+
+        _, _, _, truncated = rollout_batch(probs, 100, Ndays=3, max_days=10)
+        self.assertTrue(truncated.all())
+
+        stats, n_truncated = evaluate_policy(trader, Ndays=3, max_days=10, batch_size=100,
+                                             max_episodes=100, min_episodes=100)
+        self.assertEqual(n_truncated, 100)
+        self.assertEqual(stats["net_cashflow"].n, 0)
+
+
+
+    def test_policy_table_1(self):
+        """Traders without a tabular policy are rejected.
+        """
+        class TraderAgent_Hold(TraderAgent):
+            def make_transaction(self, *args):
+                return 0
+            def learn_from_reward(self, *args):
+                pass
+
+        with self.assertRaises(TypeError):
+            policy_table(TraderAgent_Hold(SimpleStock))
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
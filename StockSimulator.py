@@ -298,12 +298,14 @@ class SimpleStock:
 
     
 
-    def simulate_trading_day(self, Ndays=1, trader=None, print_out=False):
+    def simulate_trading_day(self, Ndays=1, trader=None, print_out=False, logger=None):
         """Simulate a number of trading days passing.
         Args:
             Ndays (int): number of trading days.
             trader (TraderAgent): a TraderAgent instance that decides the transaction
                 for each trading day.
+            logger (TrajectoryWriter): optional, records every transition
+                for offline training.
         """
         if not isinstance(trader, TraderAgent):
             sys.exit("Please provide a valid TraderAgent instance.")
@@ -319,6 +321,8 @@ class SimpleStock:
             next_state = self._transition_states()
 
             trader.learn_from_reward(actual_transaction, reward, current_state, next_state)
+            if logger is not None:
+                logger.record(actual_transaction, reward, current_state, next_state)
 
             if print_out:
                 print("==========", "Simulating day", day+1, "==========")
@@ -333,6 +337,7 @@ class SimpleStock:
             
             day += 1
 
+        trader.end_episode()
 
 
 
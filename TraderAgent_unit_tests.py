@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 from StockSimulator import SimpleStock
-from RL_Trading import TraderAgent_Random, TraderAgent_QLearning
+from RL_Trading import TraderAgent_Random, TraderAgent_QLearning, TraderAgent_DynaQ, TraderAgent_QLambda
+from PolicyEvaluation import evaluate_policy
 
 
 
@@ -60,6 +61,112 @@ class Tests(unittest.TestCase):
         self.assertTrue(result)
 
 
+    def test_dyna_q_model(self):
+        """Empirical model records every real transition.
+        """
+        trader = TraderAgent_DynaQ(SimpleStock, gamma=0.9, alpha=0.5, n_planning=5)
+        stock = SimpleStock()
+        stock.simulate_trading_day(Ndays=20, trader=trader)
+
+        n_steps = len(stock.transaction_history)
+        self.assertEqual(trader.visit_counts.sum(), n_steps)
+        self.assertEqual(sum(sum(c.values()) for c in trader.next_state_counts.values()), n_steps)
+        self.assertEqual(len(trader.observed_pairs), np.count_nonzero(trader.visit_counts))
+
+
+    def test_prioritized_sweeping(self):
+        """A real reward reaches the predecessor's Q through planning only.
+        """
+        s0, s1, s2 = SimpleStock.states[:3]
+        dyna = TraderAgent_DynaQ(SimpleStock, gamma=0.9, alpha=0.5, n_planning=5, prioritized=True)
+        plain = TraderAgent_QLearning(SimpleStock, gamma=0.9, alpha=0.5)
+
+        for trader in [dyna, plain]:
+            trader.learn_from_reward(0, 0, s0, s1)
+            trader.learn_from_reward(0, 10, s1, s2)
+
+        k = dyna.action_to_i[0]
+        self.assertEqual(plain.Q_HAT[0, k], 0)
+        self.assertAlmostEqual(dyna.Q_HAT[0, k], 0.5 * dyna._model_weight(0, k) * 0.9 * dyna.Q_HAT[1, k])
+        self.assertGreater(dyna.Q_HAT[0, k], 0)
+
+
+    def test_dyna_q_gain(self):
+        """Dyna-Q after N episodes does at least as well as Q-Learning after 2N,
+        on average over seeds.
+        """
+        def train_and_evaluate(trader, n_episodes):
+            for _ in range(n_episodes):
+                SimpleStock(random_init=True).simulate_trading_day(Ndays=14, trader=trader)
+            stats, _ = evaluate_policy(trader, batch_size=20000, min_episodes=20000, max_episodes=20000)
+            return stats["reward"].mean
+
+        dyna, plain = [], []
+        for seed in range(5):
+            np.random.seed(seed)
+            dyna.append(train_and_evaluate(TraderAgent_DynaQ(SimpleStock, gamma=0.9, alpha=0.5), 100))
+            np.random.seed(seed)
+            plain.append(train_and_evaluate(TraderAgent_QLearning(SimpleStock, gamma=0.9, alpha=0.5), 200))
+
+        self.assertGreaterEqual(np.mean(dyna), np.mean(plain))
+
+
+    def test_priority_queue_1(self):
+        """The priority queue stays bounded by the number of queued pairs.
+        """
+        trader = TraderAgent_DynaQ(SimpleStock, gamma=0.9, alpha=0.5, n_planning=10, prioritized=True)
+        for _ in range(20):
+            stock = SimpleStock(random_init=True)
+            stock.simulate_trading_day(Ndays=14, trader=trader)
+
+            self.assertLessEqual(len(trader.priority_queue), 2 * len(trader.priorities))
+            self.assertLessEqual(len(trader.priorities), len(trader.observed_pairs))
+
+
+    def test_q_lambda_traces(self):
+        """Active set matches the non-zero traces, which are reset after each episode.
+        """
+        trader = TraderAgent_QLambda(SimpleStock, gamma=0.9, alpha=0.5, lam=0.8)
+        stock = SimpleStock()
+        for _ in range(5):
+            current_state = (stock.indicator_history[-1], stock.price, stock.position)
+            transaction = trader.make_transaction(current_state)
+            actual_transaction, reward, _ = stock._process_transaction(transaction)
+            next_state = stock._transition_states()
+            trader.learn_from_reward(actual_transaction, reward, current_state, next_state)
+            self.assertEqual(set(trader.active), set(np.flatnonzero(trader.E)))
+
+        trader.end_episode()
+        self.assertEqual(len(trader.active), 0)
+        self.assertFalse(trader.E.any())
+
+
+    def test_n_step_returns(self):
+        """n-step returns truncated at the episode end.
+        """
+        trader = TraderAgent_QLambda(SimpleStock, gamma=0.5, alpha=1, n_step=2)
+        trader.Q_HAT[3] = 8
+        rewards = np.array([1., 2., 4.])
+        next_states = np.array([1, 2, 3])
+
+        returns = trader.n_step_returns(rewards, next_states)
+        self.assertTrue(np.allclose(returns, [1 + 0.5*2, 2 + 0.5*4 + 0.25*8, 4 + 0.5*8]))
+
+
+    def test_n_step_repeated_pairs(self):
+        """A pair repeated within an episode moves once towards its mean return.
+        """
+        trader = TraderAgent_QLambda(SimpleStock, gamma=0, alpha=0.5, n_step=1)
+        s0 = SimpleStock.states[0]
+        for reward in [1, 1, 1, 1, 1, 3]:
+            trader.learn_from_reward(0, reward, s0, s0)
+        trader.end_episode()
+
+        k = trader.action_to_i[0]
+        self.assertAlmostEqual(trader.Q_HAT[0, k], 0.5 * (8 / 6))
+        self.assertEqual(np.count_nonzero(trader.Q_HAT), 1)
+
+
 
 
 if __name__ == "__main__":
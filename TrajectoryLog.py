@@ -0,0 +1,213 @@
+import os
+import glob
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from StockSimulator import SimpleStock
+from RL_Trading import TraderAgent_Random
+
+
+
+class TrajectoryWriter:
+    """Logs (state, action, reward, next state) transitions to a directory of
+    chunked columnar files, so that simulated experience can be reused for
+    offline training. States and actions are int-coded as their index in
+    stock.states and stock.transactions, the same coding as the rows and
+    columns of TraderAgent_QLearning.Q_HAT.
+
+    Each chunk is a .npz file holding one array per column (state, action,
+    reward, next_state). Chunks are written to a temporary file first and
+    then renamed, so an interrupted run never leaves a partial chunk behind.
+    Pass an instance as the logger of SimpleStock.simulate_trading_day.
+
+    Attributes:
+        log_dir (str): directory the chunks are written to.
+        chunk_size (int): number of transitions per chunk.
+    """
+
+    def __init__(self, log_dir, chunk_size=100000, stock=SimpleStock):
+        """
+        Args:
+            log_dir (str): directory of the log; created if needed, and
+                appended to if it already holds chunks.
+            chunk_size (int): number of transitions per chunk.
+            stock (SimpleStock): the class name SimpleStock
+        """
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_dir = log_dir
+        self.chunk_size = chunk_size
+        self.state_to_i = {j:i for i,j in enumerate(stock.states)}
+        self.action_to_i = {j:i for i,j in enumerate(stock.transactions)}
+        self.n_chunks = len(chunk_paths(log_dir))
+        self._reset_buffer()
+
+
+    def _reset_buffer(self):
+        self.state = np.empty(self.chunk_size, dtype=np.int32)
+        self.action = np.empty(self.chunk_size, dtype=np.int16)
+        self.reward = np.empty(self.chunk_size, dtype=np.float64)
+        self.next_state = np.empty(self.chunk_size, dtype=np.int32)
+        self.size = 0
+
+
+    def record(self, transaction, reward, current_state, next_state):
+        """Buffers one transition, writing a chunk whenever the buffer is full.
+        Takes the same arguments as TraderAgent.learn_from_reward.
+        """
+        i = self.size
+        self.state[i] = self.state_to_i[current_state]
+        self.action[i] = self.action_to_i[transaction]
+        self.reward[i] = reward
+        self.next_state[i] = self.state_to_i[next_state]
+        self.size += 1
+
+        if self.size == self.chunk_size:
+            self.flush()
+
+
+    def flush(self):
+        """Writes the buffered transitions as a new chunk.
+        """
+        if self.size == 0:
+            return
+
+        path = os.path.join(self.log_dir, f"chunk_{self.n_chunks:06d}.npz")
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, state=self.state[:self.size], action=self.action[:self.size],
+                     reward=self.reward[:self.size], next_state=self.next_state[:self.size])
+        os.replace(path + ".tmp", path)
+
+        self.n_chunks += 1
+        self._reset_buffer()
+
+
+    def close(self):
+        self.flush()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+
+def chunk_paths(log_dirs):
+    """Sorted paths of all chunks in one or more log directories.
+    """
+    if isinstance(log_dirs, str):
+        log_dirs = [log_dirs]
+
+    return [p for d in log_dirs for p in sorted(glob.glob(os.path.join(d, "chunk_*.npz")))]
+
+
+
+def iter_chunks(log_dirs):
+    """Streams the logged transitions one chunk at a time.
+    Args:
+        log_dirs (str or list[str]): one or more log directories.
+    Yields:
+        state, action, reward, next_state (np.ndarray): columns of one chunk.
+    """
+    for path in chunk_paths(log_dirs):
+        with np.load(path) as chunk:
+            yield chunk["state"], chunk["action"], chunk["reward"].astype(float), chunk["next_state"]
+
+
+
+def _log_episodes(log_dir, n_episodes, Ndays, transaction_cost, chunk_size, seed):
+    """Simulates n_episodes of a TraderAgent_Random into one log directory.
+    """
+    np.random.seed(seed)
+    trader = TraderAgent_Random(SimpleStock)
+
+    with TrajectoryWriter(log_dir, chunk_size) as logger:
+        for _ in range(n_episodes):
+            stock = SimpleStock(transaction_cost=transaction_cost, random_init=True)
+            stock.simulate_trading_day(Ndays=Ndays, trader=trader, logger=logger)
+
+    return log_dir
+
+
+
+def generate_logs(log_dir, n_episodes, n_workers=4, Ndays=14, transaction_cost=0,
+                  chunk_size=100000, seed=0):
+    """Generates trajectory logs of a random trader on several cores.
+    Each worker writes its own sub-directory of log_dir.
+    Returns:
+        (list[str]): the log directories written, to pass to the offline trainers.
+    """
+    log_dirs = [os.path.join(log_dir, f"worker_{w:03d}") for w in range(n_workers)]
+    episodes = [n_episodes // n_workers + (w < n_episodes % n_workers) for w in range(n_workers)]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(_log_episodes, d, n, Ndays, transaction_cost, chunk_size, seed + w)
+                   for w, (d, n) in enumerate(zip(log_dirs, episodes))]
+        return [future.result() for future in futures]
+
+
+
+
+def fitted_q_iteration(trader, log_dirs, n_iterations=50, tol=1e-6):
+    """Offline fitted-Q iteration of a TraderAgent_QLearning's Q_HAT from logs.
+    Every iteration streams all chunks once and sets each logged (state, action)
+    pair to the mean of its targets reward + gamma * max Q_HAT[next_state]
+    (a tabular regression); pairs never logged are left as they are.
+    Args:
+        trader (TraderAgent_QLearning): trader whose Q_HAT is updated in place.
+        log_dirs (str or list[str]): one or more log directories.
+        n_iterations (int): maximum number of passes over the logs.
+        tol (float): stop once no entry of Q_HAT changes by more than tol.
+    Returns:
+        (int): number of iterations run.
+    """
+    for iteration in range(1, n_iterations+1):
+        V = np.max(trader.Q_HAT, axis=1)
+        target_sums = np.zeros(trader.Q_HAT.size)
+        counts = np.zeros(trader.Q_HAT.size)
+
+        for state, action, reward, next_state in iter_chunks(log_dirs):
+            chunk_sums, chunk_counts = trader.sum_targets(state, action, reward + trader.gamma * V[next_state])
+            target_sums += chunk_sums
+            counts += chunk_counts
+
+        if trader.batch_update_q(target_sums, counts, alpha=1) <= tol:
+            break
+
+    return iteration
+
+
+
+def batch_q_learning(trader, log_dirs, n_epochs=10):
+    """Offline Q-Learning of a TraderAgent_QLearning's Q_HAT from logs, with
+    the trader's learning rate alpha. Each chunk is applied as one batch: its
+    targets use Q_HAT as of the start of the chunk, and every logged pair moves
+    towards the mean of its targets within the chunk.
+    Args:
+        trader (TraderAgent_QLearning): trader whose Q_HAT is updated in place.
+        log_dirs (str or list[str]): one or more log directories.
+        n_epochs (int): number of passes over the logs.
+    """
+    for _ in range(n_epochs):
+        for state, action, reward, next_state in iter_chunks(log_dirs):
+            targets = reward + trader.gamma * np.max(trader.Q_HAT[next_state], axis=1)
+            trader.batch_update_q(*trader.sum_targets(state, action, targets))
+
+
+
+if __name__ == "__main__":
+
+    from RL_Trading import TraderAgent_QLearning
+
+    log_dirs = generate_logs("trajectory_logs", n_episodes=20000, n_workers=4)
+
+    trader = TraderAgent_QLearning(stock=SimpleStock, gamma=0.9, alpha=0.5)
+    n_iterations = fitted_q_iteration(trader, log_dirs)
+    print("Fitted-Q iterations:", n_iterations)
+
+    stock = SimpleStock(random_init=True)
+    stock.simulate_trading_day(Ndays=14, trader=trader, print_out=False)
+    print("Transactions:", stock.transaction_history)
+    print("Net CF:", sum(stock.cashflow_history))
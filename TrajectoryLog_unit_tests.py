@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from StockSimulator import SimpleStock
+from RL_Trading import TraderAgent_Random, TraderAgent_QLearning
+from TrajectoryLog import TrajectoryWriter, chunk_paths, iter_chunks, fitted_q_iteration, batch_q_learning
+
+
+class Tests(unittest.TestCase):
+
+    def test_writer_1(self):
+        """Every simulated transition is logged, int-coded and chunked.
+        """
+        np.random.seed(0)
+        trader = TraderAgent_Random(SimpleStock)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with TrajectoryWriter(tmp, chunk_size=7) as logger:
+                # a non-binary transaction cost, logged rewards must still match exactly
+                stock = SimpleStock(transaction_cost=0.1)
+                stock.simulate_trading_day(Ndays=20, trader=trader, logger=logger)
+
+            self.assertEqual(len(chunk_paths(tmp)), 3)
+            state, action, reward, next_state = (np.concatenate(c) for c in zip(*iter_chunks(tmp)))
+
+        self.assertEqual(len(state), 20)
+        self.assertEqual([SimpleStock.transactions[a] for a in action], stock.transaction_history)
+        self.assertTrue(np.array_equal(reward, stock.reward_history))
+        self.assertTrue(np.array_equal(state[1:], next_state[:-1]))
+        self.assertEqual(SimpleStock.states[next_state[-1]],
+                         (stock.indicator_history[-1], stock.price, stock.position))
+
+
+    def test_fitted_q_1(self):
+        """Fitted-Q iteration on a logged two-step chain.
+        """
+        trader = TraderAgent_QLearning(SimpleStock, gamma=0.5, alpha=1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with TrajectoryWriter(tmp) as logger:
+                s0, s1, s2 = SimpleStock.states[:3]
+                logger.record(0, 2, s0, s1)
+                logger.record(0, 4, s0, s1)
+                logger.record(1, 8, s1, s2)
+
+            fitted_q_iteration(trader, tmp)
+            i0 = trader.action_to_i[0]
+            i1 = trader.action_to_i[1]
+            self.assertAlmostEqual(trader.Q_HAT[1, i1], 8)
+            self.assertAlmostEqual(trader.Q_HAT[0, i0], 3 + 0.5*8)
+            self.assertEqual(np.count_nonzero(trader.Q_HAT), 2)
+
+            other = TraderAgent_QLearning(SimpleStock, gamma=0.5, alpha=1)
+            batch_q_learning(other, tmp, n_epochs=2)
+            self.assertTrue(np.allclose(other.Q_HAT, trader.Q_HAT))
+
+            # non-contiguous Q_HAT is still updated in place
+            other = TraderAgent_QLearning(SimpleStock, gamma=0.5, alpha=1)
+            other.Q_HAT = np.asfortranarray(other.Q_HAT)
+            batch_q_learning(other, tmp, n_epochs=2)
+            self.assertTrue(np.allclose(other.Q_HAT, trader.Q_HAT))
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()